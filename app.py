@@ -285,9 +285,8 @@ class MainWindow(QMainWindow):
 
         self.setWindowTitle(self.program_name)
 
-        pattern = '????????_????_iono.ion'
-
-        if file_name and fnmatch(path.split(file_name)[-1], pattern):
+        if file_name and fnmatch(path.split(file_name)[-1],
+                                 FileList.ION_PATTERN):
             self.clear_all()
 
             self.iono = RinanIono()
@@ -356,11 +355,7 @@ class MainWindow(QMainWindow):
             self.open_file(self.file_name)
 
     def get_filelist(self, directory):
-        result = []
-        for filename in FileList.get(directory):
-            if fnmatch(filename, '????????_????_iono.ion'):
-                result.append(filename)
-        return result
+        return FileList.get(directory, FileList.ION_PATTERN)
 
     def load_text_info(self):
         try:
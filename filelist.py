@@ -1,13 +1,19 @@
 from os import walk
+from fnmatch import fnmatch
 
 class FileList:
 
+    ION_PATTERN = '????????_????_iono.ion'
+
     @staticmethod
-    def get(directory):
+    def get(directory, pattern=None):
         file_names = []
         for (dp, dn, fn) in walk(directory):
             file_names.extend(fn)
             break
 
+        if pattern:
+            file_names = [x for x in file_names if fnmatch(x, pattern)]
+
         file_names.sort()
         return file_names
@@ -0,0 +1,280 @@
+import re
+import sys
+import json
+import mmap
+import argparse
+from os import path
+from hashlib import md5
+from datetime import datetime
+from collections import Counter
+from multiprocessing import Pool
+
+from filelist import FileList
+
+
+class IonValidator:
+    """Checks the structure of .ion files without loading amplitudes.
+
+    Files are memory-mapped and only section markers, row counts and
+    field counts are inspected, so a whole archive can be scanned much
+    faster than with RinanIono.load.
+    """
+
+    CACHE_NAME = path.join(path.expanduser('~'), '.ion_validator_cache.json')
+
+    RE_FREQ = re.compile(rb'^[ \t]*Frequency Set[ \t]*\r?$', re.M)
+    RE_END = re.compile(rb'^[ \t]*END[ \t]*\r?$', re.M)
+    RE_DATA = re.compile(rb'^[ \t]*DATA[ \t]*\r?$', re.M)
+    RE_NSTROB = re.compile(rb'^[ \t]*Nstrob[ \t]*=(.*)$', re.M)
+    RE_TIME = re.compile(rb'^[ \t]*TIME[ \t]*=(.*)$', re.M)
+    RE_FREQ_ROW = re.compile(rb'[ \t]*\d+[ \t]+([-+.0-9eE]+)[ \t]*\r?')
+    RE_BLANK = re.compile(rb'\s*')
+    RE_FIELD = re.compile(rb'\S+')
+
+    def __init__(self, directory, jobs=None, cache_name=None):
+        self.directory = path.abspath(directory)
+        self.jobs = jobs
+        self.cache_name = cache_name if cache_name else self.CACHE_NAME
+        self.cache = self.load_cache()
+
+    def load_cache(self):
+        try:
+            with open(self.cache_name) as file:
+                cache = json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+        if (not isinstance(cache, dict)
+                or not all(isinstance(x, dict) for x in cache.values())):
+            return {}
+        return cache
+
+    @staticmethod
+    def is_valid_entry(entry, mtime):
+        """Checks that cached entry is up to date and has all fields."""
+        return (entry.get('mtime') == mtime
+                and isinstance(entry.get('errors'), list)
+                and isinstance(entry.get('n_freq'), int)
+                and isinstance(entry.get('freq_hash'), (str, type(None)))
+                and isinstance(entry.get('std'), bool))
+
+    def save_cache(self):
+        try:
+            with open(self.cache_name, 'w') as file:
+                json.dump(self.cache, file, indent=1, sort_keys=True)
+        except OSError as e:
+            sys.stderr.write('Cannot save cache {}: {}\n'.format(
+                self.cache_name, e))
+
+    def scan(self):
+        file_names = FileList.get(self.directory, FileList.ION_PATTERN)
+        # cache is shared between archives, so keys are full paths
+        full_names = [path.join(self.directory, x) for x in file_names]
+
+        to_check = []
+        for full_name in full_names:
+            mtime = path.getmtime(full_name)
+            cached = self.cache.get(full_name)
+            if (cached is None
+                    or not IonValidator.is_valid_entry(cached, mtime)):
+                to_check.append(full_name)
+
+        if to_check:
+            with Pool(self.jobs) as pool:
+                results = pool.map(IonValidator.check_file, to_check,
+                                   chunksize=16)
+            for full_name, result in zip(to_check, results):
+                self.cache[full_name] = result
+
+        # forget files removed from the archive
+        present = set(full_names)
+        self.cache = {k: v for k, v in self.cache.items()
+                      if k in present or path.dirname(k) != self.directory}
+        self.save_cache()
+
+        # .STD files may appear without changes of .ion file
+        for full_name in full_names:
+            self.cache[full_name]['std'] = path.isfile(full_name + '.STD')
+
+        return {file_name: self.cache[full_name]
+                for file_name, full_name in zip(file_names, full_names)}
+
+    @staticmethod
+    def iter_lines(m, start, end):
+        """Yields (begin, end) of lines following the line at start."""
+        pos = m.find(b'\n', start, end)
+        while pos != -1 and pos + 1 < end:
+            line_start = pos + 1
+            pos = m.find(b'\n', line_start, end)
+            yield line_start, pos if pos != -1 else end
+
+    @staticmethod
+    def check_file(file_name):
+        result = {
+            'mtime': path.getmtime(file_name),
+            'errors': [],
+            'n_freq': 0,
+            'freq_hash': None,
+            'std': path.isfile(file_name + '.STD')}
+        errors = result['errors']
+
+        try:
+            with open(file_name, 'rb') as file:
+                if path.getsize(file_name) == 0:
+                    errors.append('empty file')
+                    return result
+                with mmap.mmap(file.fileno(), 0,
+                               access=mmap.ACCESS_READ) as m:
+                    IonValidator.check_structure(m, result)
+        except OSError as e:
+            errors.append('cannot read file: {}'.format(e))
+
+        return result
+
+    @staticmethod
+    def check_structure(m, result):
+        errors = result['errors']
+
+        match_freq = IonValidator.RE_FREQ.search(m)
+        if not match_freq:
+            errors.append('no "Frequency Set" section')
+            return
+
+        match_end = IonValidator.RE_END.search(m, match_freq.end())
+        if not match_end:
+            errors.append('no END of header')
+            return
+
+        # every line between "Frequency Set" and END counts, as in
+        # RinanIono.load
+        n_freq = 0
+        n_parsed = 0
+        freq_hash = md5()
+        freq_error = None
+        for i, (begin, end) in enumerate(IonValidator.iter_lines(
+                m, match_freq.end(), match_end.start())):
+            n_freq += 1
+            match_row = IonValidator.RE_FREQ_ROW.fullmatch(m, begin, end)
+            if match_row:
+                n_parsed += 1
+                freq_hash.update(match_row.group(1) + b' ')
+            elif freq_error is None:
+                if IonValidator.RE_BLANK.fullmatch(m, begin, end):
+                    freq_error = 'Frequency Set line {} is blank'
+                else:
+                    freq_error = 'Frequency Set line {} is malformed'
+                freq_error = freq_error.format(i + 1)
+        if freq_error:
+            errors.append(freq_error)
+        result['n_freq'] = n_freq
+        # only frequency values define the set; an empty set is a header
+        # error, not a different set
+        if n_parsed:
+            result['freq_hash'] = freq_hash.hexdigest()
+        else:
+            errors.append('no frequencies in Frequency Set')
+
+        nstrob = None
+        match_nstrob = IonValidator.RE_NSTROB.search(m, 0, match_freq.start())
+        if not match_nstrob:
+            errors.append('no Nstrob in header')
+        else:
+            try:
+                nstrob = int(match_nstrob.group(1).strip())
+            except ValueError:
+                errors.append('malformed Nstrob')
+
+        match_time = IonValidator.RE_TIME.search(m, match_end.end())
+        if not match_time:
+            errors.append('no TIME')
+        else:
+            date = match_time.group(1).strip().decode(errors='replace')
+            if date.endswith(' UT'):
+                date = date[:-3]
+            try:
+                datetime.strptime(date, '%d.%m.%Y %H:%M:%S')
+            except ValueError:
+                errors.append('malformed TIME "{}"'.format(date))
+
+        match_data = IonValidator.RE_DATA.search(m, match_end.end())
+        if not match_data:
+            errors.append('no DATA section')
+            return
+
+        match_data_end = IonValidator.RE_END.search(m, match_data.end())
+        if not match_data_end:
+            errors.append('no END of data (truncated file?)')
+            data_end = len(m)
+        else:
+            data_end = match_data_end.start()
+
+        n_rows = 0
+        row_error = None
+        for begin, end in IonValidator.iter_lines(
+                m, match_data.end(), data_end):
+            n_rows += 1
+            if nstrob is not None and row_error is None:
+                n_fields = sum(1 for _ in IonValidator.RE_FIELD.finditer(
+                    m, begin, end))
+                if n_fields != nstrob:
+                    row_error = 'row {}: {} fields, Nstrob is {}'.format(
+                        n_rows, n_fields, nstrob)
+
+        if n_rows != n_freq:
+            errors.append('{} data rows, {} frequencies'.format(
+                n_rows, n_freq))
+        if row_error:
+            errors.append(row_error)
+
+    @staticmethod
+    def make_report(results):
+        lines = []
+
+        bad = [(k, v) for k, v in results.items() if v['errors']]
+        lines.append('Bad files: {}'.format(len(bad)))
+        for file_name, result in bad:
+            for error in result['errors']:
+                lines.append('  {}: {}'.format(file_name, error))
+        lines.append('')
+
+        hashes = Counter(v['freq_hash'] for v in results.values()
+                         if v['freq_hash'])
+        mismatched = []
+        if hashes:
+            common = hashes.most_common(1)[0][0]
+            mismatched = [(k, v) for k, v in results.items()
+                          if v['freq_hash'] and v['freq_hash'] != common]
+        lines.append('Mismatched frequency sets: {}'.format(len(mismatched)))
+        for file_name, result in mismatched:
+            lines.append('  {}: {} frequencies'.format(
+                file_name, result['n_freq']))
+        lines.append('')
+
+        no_std = [k for k, v in results.items() if not v['std']]
+        lines.append('Missing .STD files: {}'.format(len(no_std)))
+        for file_name in no_std:
+            lines.append('  {}'.format(file_name))
+
+        return '\n'.join(lines) + '\n'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Check structure of .ion files in a directory.')
+    parser.add_argument('directory')
+    parser.add_argument('-o', '--output', help='report file (default stdout)')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of worker processes')
+    parser.add_argument('-c', '--cache',
+                        help='cache file (default {})'.format(
+                            IonValidator.CACHE_NAME))
+    args = parser.parse_args()
+
+    validator = IonValidator(args.directory, args.jobs, args.cache)
+    report = IonValidator.make_report(validator.scan())
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(report)
+    else:
+        sys.stdout.write(report)